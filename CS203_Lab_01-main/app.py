@@ -1,47 +1,131 @@
-import json
+import atexit
+import hashlib
 import os
+import queue
+import sqlite3
+import threading
 import time
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session
 from opentelemetry import trace, metrics
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
 from opentelemetry.trace import SpanKind
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from pythonjsonlogger import jsonlogger  # Import the jsonlogger for structured logging
 
 # Flask App Initialization
 app = Flask(__name__)
 app.secret_key = 'secret'
-COURSE_FILE = 'course_catalog.json'
+DB_FILE = 'course_catalog.db'
+COURSE_FILE = 'course_catalog.jsonl'  # Seed data imported into an empty database
+COURSE_FIELDS = ('code', 'name', 'instructor', 'semester', 'schedule',
+                 'classroom', 'prerequisites', 'grading', 'description')
+INSERT_COURSE = f"INSERT INTO courses VALUES ({', '.join(':' + col for col in COURSE_FIELDS)})"
+
+# One SQLite connection per thread, reused across requests
+_local = threading.local()
+
+# Rendered pages keyed by template name -> (version, html, etag)
+_PAGE_CACHE = {}
+
+# Fast JSON (orjson) with a stdlib fallback exposing the same bytes-based API
+try:
+    import orjson
+
+    def json_loads(raw):
+        return orjson.loads(raw)
+except ImportError:
+    import json
+    orjson = None
+
+    def json_loads(raw):
+        return json.loads(raw)
 
 # Configure structured logging (JSON format)
+class OrjsonFormatter(jsonlogger.JsonFormatter):
+    """JsonFormatter that serializes log records with orjson when it is installed."""
+
+    def jsonify_log_record(self, log_record):
+        if orjson is None:
+            return super().jsonify_log_record(log_record)
+        # OPT_NON_STR_KEYS accepts dicts with non-string keys in extras, as the stdlib serializer does
+        return orjson.dumps(log_record, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+class RecordQueueHandler(QueueHandler):
+    """QueueHandler that enqueues records untouched.
+
+    The stock prepare() formats the message and traceback on the calling thread and clears
+    exc_info; the queue is in-process, so the listener's JSON formatter can do all of it.
+    """
+
+    def prepare(self, record):
+        return record
+
 log_handler = logging.StreamHandler()  # Output logs to stdout
-formatter = jsonlogger.JsonFormatter('%(asctime)s %(name)s %(levelname)s %(message)s')
+formatter = OrjsonFormatter('%(asctime)s %(name)s %(levelname)s %(message)s')
 log_handler.setFormatter(formatter)
+# Hand records to a background listener so formatting and stdout writes stay off request threads
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # Flush queued records on shutdown
 logger = logging.getLogger(__name__)
-logger.addHandler(log_handler)
+logger.addHandler(RecordQueueHandler(log_queue))
 logger.setLevel(logging.INFO)  # Set the log level to INFO
 
 # Configure OpenTelemetry Tracing
-from opentelemetry.exporter.otlp.trace import OTLPSpanExporter
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+
+# Console exporters format synchronously to stdout, so they are opt-in for local debugging only
+OTEL_CONSOLE = os.getenv("OTEL_CONSOLE") == "1"
 
 # Configure OTLP exporter
 otlp_exporter = OTLPSpanExporter()
 
+# Record ~10% of traces by default; unsampled spans are cheap no-ops. If OTEL_TRACES_SAMPLER is
+# set the SDK builds the sampler from the environment, otherwise OTEL_TRACES_SAMPLER_ARG sets the
+# ratio, falling back to 0.1 when it is malformed or outside [0, 1]
+if os.getenv("OTEL_TRACES_SAMPLER"):
+    sampler = None
+else:
+    try:
+        sample_ratio = float(os.getenv("OTEL_TRACES_SAMPLER_ARG", 0.1))
+    except ValueError:
+        sample_ratio = 0.1
+    if not 0.0 <= sample_ratio <= 1.0:
+        sample_ratio = 0.1
+    sampler = ParentBased(TraceIdRatioBased(sample_ratio))
+
 # Add OTLP exporter to the tracer provider
-tracer_provider = TracerProvider()
+tracer_provider = TracerProvider(sampler=sampler)
+# Batch settings tuned for request throughput, applied only where OTEL_BSP_* is unset;
+# the SDK parses these itself and falls back to its defaults on malformed values
+os.environ.setdefault("OTEL_BSP_MAX_QUEUE_SIZE", "4096")
+os.environ.setdefault("OTEL_BSP_SCHEDULE_DELAY", "1000")
+os.environ.setdefault("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "256")
+os.environ.setdefault("OTEL_BSP_EXPORT_TIMEOUT", "10000")
 tracer_provider.add_span_processor(BatchSpanProcessor(otlp_exporter))
+if OTEL_CONSOLE:
+    tracer_provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
 trace.set_tracer_provider(tracer_provider)
 FlaskInstrumentor().instrument_app(app)
 tracer = trace.get_tracer(__name__)
 
 # Configure OpenTelemetry Metrics
-meter_provider = MeterProvider()
-metric_reader = PeriodicExportingMetricReader(ConsoleMetricExporter(), export_interval_millis=5000)
-meter_provider.add_metric_reader(metric_reader)  # Correct method for adding the reader
+# Metrics need an OTLP collector (Jaeger does not accept them), so only export when one is configured
+if OTEL_CONSOLE:
+    metric_readers = [PeriodicExportingMetricReader(ConsoleMetricExporter(), export_interval_millis=5000)]
+elif os.getenv("OTEL_EXPORTER_OTLP_METRICS_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+    metric_readers = [PeriodicExportingMetricReader(OTLPMetricExporter(), export_interval_millis=15000)]
+else:
+    metric_readers = []  # Instruments still work, nothing is exported
+meter_provider = MeterProvider(metric_readers=metric_readers)
 metrics.set_meter_provider(meter_provider)
 meter = metrics.get_meter(__name__)
 
@@ -62,49 +146,118 @@ error_counter = meter.create_counter(
     unit="1"
 )
 
+# Metric attribute dicts shared per (method, route) so hot paths don't allocate new ones
+_ATTR_CACHE = {}
+KNOWN_METHODS = frozenset(("GET", "POST", "HEAD", "OPTIONS"))
+
 # Utility Functions
+def metric_attrs(method, route):
+    """Return the shared metric attribute dict for a method/route pair; callers must not mutate it."""
+    attrs = _ATTR_CACHE.get((method, route))
+    if attrs is None:
+        attrs = _ATTR_CACHE.setdefault((method, route), {"route": route, "method": method})
+    return attrs
+
+def get_db():
+    """Return this thread's SQLite connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = course_from_row
+        conn.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL and avoids an fsync per commit
+        _local.conn = conn
+    return conn
+
+def course_from_row(cursor, row):
+    """Build a course dict from a row, leaving out unset fields like the old JSON entries."""
+    return {col[0]: value for col, value in zip(cursor.description, row) if value is not None}
+
+def init_db():
+    """Create the courses table and seed it from the JSON Lines file when it is empty."""
+    # Use a throwaway connection so nothing opened at import time is shared across forked workers
+    conn = sqlite3.connect(DB_FILE)
+    conn.execute('PRAGMA journal_mode=WAL')  # Persistent; readers never block the writer
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS courses (code TEXT PRIMARY KEY, {', '.join(COURSE_FIELDS[1:])})")
+        if conn.execute('SELECT 1 FROM courses LIMIT 1').fetchone() is None and os.path.exists(COURSE_FILE):
+            with open(COURSE_FILE, 'rb') as file:
+                seed = [json_loads(line) for line in file if line.strip()]
+            # OR IGNORE keeps the first entry for a repeated code, matching the old lookup
+            conn.executemany(
+                INSERT_COURSE.replace('INSERT', 'INSERT OR IGNORE', 1),
+                [{col: course.get(col) for col in COURSE_FIELDS} for course in seed],
+            )
+    conn.close()
+
+init_db()
+
 def load_courses():
-    """Load courses from the JSON file."""
-    if not os.path.exists(COURSE_FILE):
-        return []  # Return an empty list if the file doesn't exist
-    with open(COURSE_FILE, 'r') as file:
-        return json.load(file)
+    """Load all courses in insertion order."""
+    return get_db().execute('SELECT * FROM courses ORDER BY rowid').fetchall()
+
+def load_course(code):
+    """Return the course with the given code, or None."""
+    return get_db().execute('SELECT * FROM courses WHERE code = ?', (code,)).fetchone()
 
 def save_courses(data):
-    """Save new course data to the JSON file."""
-    courses = load_courses()  # Load existing courses
-    courses.append(data)  # Append the new course
-    with open(COURSE_FILE, 'w') as file:
-        json.dump(courses, file, indent=4)
+    """Insert a new course; raises sqlite3.IntegrityError if the code already exists."""
+    conn = get_db()
+    with conn:
+        conn.execute(INSERT_COURSE, {col: data.get(col) for col in COURSE_FIELDS})
+
+def catalog_stats():
+    """Return (version, count) for the courses table without loading any rows.
+
+    The version is max(rowid), which changes whenever a course is added; an empty table gives None.
+    """
+    cursor = get_db().cursor()
+    cursor.row_factory = None  # Plain tuples, not course dicts
+    return cursor.execute('SELECT max(rowid), count(*) FROM courses').fetchone()
+
+def render_cached(template, version=None, load_context=dict):
+    """Render a template once per version and serve it with an ETag.
+
+    load_context returns the template context and is only called when the page is rendered,
+    so cache hits skip it. Pages with pending flash messages differ per session, so they are
+    rendered fresh.
+    """
+    if '_flashes' in session:
+        return render_template(template, **load_context())
+    cached = _PAGE_CACHE.get(template)
+    if cached is None or cached[0] != version:
+        html = render_template(template, **load_context())
+        cached = _PAGE_CACHE[template] = (version, html, hashlib.sha1(html.encode('utf-8')).hexdigest())
+    response = Response(cached[1], mimetype='text/html')
+    response.set_etag(cached[2])
+    return response.make_conditional(request)
 
 # Flask Routes
 @app.before_request
 def before_request():
-    """Start a span for each request and note the start time."""
-    request.start_time = time.time()
-    request.span = tracer.start_span(
-        f"{request.method} {request.path}",
-        attributes={
-            "http.method": request.method,
-            "http.url": request.url,
-        },
-    )
+    """Note the request start time (FlaskInstrumentor already opens the request span)."""
+    request.start_ns = time.perf_counter_ns()
 
 @app.after_request
 def after_request(response):
-    """Close the span, log metadata, and collect metrics."""
-    duration = (time.time() - request.start_time) * 1000  # Convert to milliseconds
-    request.span.set_attribute("http.status_code", response.status_code)
+    """Annotate the request span, log metadata, and collect metrics."""
+    duration = (time.perf_counter_ns() - request.start_ns) / 1_000_000  # Convert to milliseconds
+    span = trace.get_current_span()
+    span.set_attribute("http.status_code", response.status_code)
     if response.status_code >= 400:
-        request.span.set_attribute("error", True)
+        span.set_attribute("error", True)
 
     # Update Metrics
-    route_request_counter.add(1, {"route": request.path, "method": request.method})
-    route_processing_time.record(duration, {"route": request.path, "method": request.method})
+    # Label by view function so /course/<code> is one series. Unrouted requests (404/405) share
+    # one label, and their client-chosen method is bounded to a known set
+    if request.endpoint is not None:
+        attrs = metric_attrs(request.method, request.endpoint)
+    else:
+        method = request.method if request.method in KNOWN_METHODS else "other"
+        attrs = metric_attrs(method, "unmatched")
+    route_request_counter.add(1, attrs)
+    route_processing_time.record(duration, attrs)
     if response.status_code >= 400:
-        error_counter.add(1, {"route": request.path, "method": request.method})
-
-    request.span.end()
+        error_counter.add(1, attrs)
 
     # Log request metadata
     logger.info("Request processed", extra={
@@ -128,7 +281,7 @@ def index():
             "method": request.method,
             "user_ip": request.remote_addr
         })
-    return render_template('index.html')
+    return render_cached('index.html')
 
 @app.route('/catalog')
 def course_catalog():
@@ -143,10 +296,10 @@ def course_catalog():
             "method": request.method,
             "user_ip": request.remote_addr
         })
-    courses = load_courses()
-    current_span.set_attribute("course.count", len(courses))
-    current_span.set_attribute("course.names", [course['name'] for course in courses])
-    return render_template('course_catalog.html', courses=courses)
+    # Read the version before any rows so a concurrent insert can only make a render newer than it
+    version, count = catalog_stats()
+    current_span.set_attribute("course.count", count)  # A count keeps span size constant
+    return render_cached('course_catalog.html', version, lambda: {'courses': load_courses()})
 
 @app.route('/add_courses', methods=['GET', 'POST'])
 def add_courses():
@@ -166,15 +319,14 @@ def add_courses():
         instructor = request.form.get('instructor')
 
         # Validate required fields
-        if not course_code or not course_name or not instructor:
-            missing_fields = []
-            if not course_code:
-                missing_fields.append("Course Code")
-            if not course_name:
-                missing_fields.append("Course Name")
-            if not instructor:
-                missing_fields.append("Instructor")
-            error_counter.add(1, {"route": "/add_courses", "error_type": "missing_fields"})
+        if not (course_code and course_name and instructor):
+            # Only build the list of missing fields on the error path
+            missing_fields = [label for label, value in (
+                ("Course Code", course_code),
+                ("Course Name", course_name),
+                ("Instructor", instructor),
+            ) if not value]
+            error_counter.add(1, {"route": request.endpoint, "error_type": "missing_fields"})
             logger.error("Missing required fields", extra={
                 "missing_fields": missing_fields,
                 "route": "/add_courses",
@@ -191,7 +343,18 @@ def add_courses():
             "instructor": instructor,
         }
 
-        save_courses(course)
+        try:
+            save_courses(course)
+        except sqlite3.IntegrityError:
+            error_counter.add(1, {"route": request.endpoint, "error_type": "duplicate_code"})
+            logger.error("Course code already exists", extra={
+                "course_code": course_code,
+                "route": "/add_courses",
+                "method": request.method,
+                "user_ip": request.remote_addr
+            })
+            flash(f"Error: A course with code '{course_code}' already exists.", "error")
+            return redirect(url_for('course_catalog'))
         current_span.set_attribute("course.code", course_code)
         current_span.set_attribute("course.name", course_name)
         current_span.set_attribute("course.instructor", instructor)
@@ -215,18 +378,17 @@ def course_details(code):
         current_span.set_attribute("user.ip", request.remote_addr)
         current_span.set_attribute("route", f"/course/{code}")
         current_span.set_attribute("course.code", code)
-        logger.info(f"Successfully rendered Course Details for {code}", extra={
+        logger.info("Successfully rendered Course Details for %s", code, extra={
             "course_code": code,
             "route": f"/course/{code}",
             "method": request.method,
             "user_ip": request.remote_addr
         })
 
-    courses = load_courses()
-    course = next((course for course in courses if course['code'] == code), None)
+    course = load_course(code)
     if not course:
         current_span.set_attribute("error", True)
-        logger.error(f"No course found with code: {code}", extra={
+        logger.error("No course found with code: %s", code, extra={
             "course_code": code,
             "route": f"/course/{code}",
             "method": request.method,
@@ -238,4 +400,5 @@ def course_details(code):
     return render_template('course_details.html', course=course)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; in production run `gunicorn app:app` (see gunicorn.conf.py)
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', threaded=True)
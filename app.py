@@ -1,45 +1,135 @@
-import json
+import hashlib
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import sqlite3
+import threading
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session
 
 # Flask App Initialization
 app = Flask(__name__)
 app.secret_key = 'secret'
-COURSE_FILE = 'course_catalog.json'
+DB_FILE = 'course_catalog.db'
+COURSE_FILE = 'course_catalog.jsonl'  # Seed data imported into an empty database
+COURSE_FIELDS = ('code', 'name', 'instructor', 'semester', 'schedule',
+                 'classroom', 'prerequisites', 'grading', 'description')
+INSERT_COURSE = f"INSERT INTO courses VALUES ({', '.join(':' + col for col in COURSE_FIELDS)})"
+
+# One SQLite connection per thread, reused across requests
+_local = threading.local()
+
+# Rendered pages keyed by template name -> (version, html, etag)
+_PAGE_CACHE = {}
+
+# Fast JSON (orjson) with a stdlib fallback exposing the same bytes-based API
+try:
+    import orjson
+
+    def json_loads(raw):
+        return orjson.loads(raw)
+except ImportError:
+    import json
+
+    def json_loads(raw):
+        return json.loads(raw)
 
 
 # Utility Functions
+def get_db():
+    """Return this thread's SQLite connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = course_from_row
+        conn.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL and avoids an fsync per commit
+        _local.conn = conn
+    return conn
+
+
+def course_from_row(cursor, row):
+    """Build a course dict from a row, leaving out unset fields like the old JSON entries."""
+    return {col[0]: value for col, value in zip(cursor.description, row) if value is not None}
+
+
+def init_db():
+    """Create the courses table and seed it from the JSON Lines file when it is empty."""
+    # Use a throwaway connection so nothing opened at import time is shared across forked workers
+    conn = sqlite3.connect(DB_FILE)
+    conn.execute('PRAGMA journal_mode=WAL')  # Persistent; readers never block the writer
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS courses (code TEXT PRIMARY KEY, {', '.join(COURSE_FIELDS[1:])})")
+        if conn.execute('SELECT 1 FROM courses LIMIT 1').fetchone() is None and os.path.exists(COURSE_FILE):
+            with open(COURSE_FILE, 'rb') as file:
+                seed = [json_loads(line) for line in file if line.strip()]
+            # OR IGNORE keeps the first entry for a repeated code, matching the old lookup
+            conn.executemany(
+                INSERT_COURSE.replace('INSERT', 'INSERT OR IGNORE', 1),
+                [{col: course.get(col) for col in COURSE_FIELDS} for course in seed],
+            )
+    conn.close()
+
+
+init_db()
+
+
 def load_courses():
-    """Load courses from the JSON file."""
-    if not os.path.exists(COURSE_FILE):
-        return []  # Return an empty list if the file doesn't exist
-    with open(COURSE_FILE, 'r') as file:
-        return json.load(file)
+    """Load all courses in insertion order."""
+    return get_db().execute('SELECT * FROM courses ORDER BY rowid').fetchall()
+
+
+def load_course(code):
+    """Return the course with the given code, or None."""
+    return get_db().execute('SELECT * FROM courses WHERE code = ?', (code,)).fetchone()
 
 
 def save_courses(data):
-    """Save new course data to the JSON file."""
-    courses = load_courses()  # Load existing courses
-    courses.append(data)  # Append the new course
-    with open(COURSE_FILE, 'w') as file:
-        json.dump(courses, file, indent=4)
+    """Insert a new course; raises sqlite3.IntegrityError if the code already exists."""
+    conn = get_db()
+    with conn:
+        conn.execute(INSERT_COURSE, {col: data.get(col) for col in COURSE_FIELDS})
+
+
+def catalog_version():
+    """Return max(rowid) of the courses table, which changes whenever a course is added.
+
+    An empty table gives None.
+    """
+    cursor = get_db().cursor()
+    cursor.row_factory = None  # Plain tuples, not course dicts
+    return cursor.execute('SELECT max(rowid) FROM courses').fetchone()[0]
+
+
+def render_cached(template, version=None, load_context=dict):
+    """Render a template once per version and serve it with an ETag.
+
+    load_context returns the template context and is only called when the page is rendered,
+    so cache hits skip it. Pages with pending flash messages differ per session, so they are
+    rendered fresh.
+    """
+    if '_flashes' in session:
+        return render_template(template, **load_context())
+    cached = _PAGE_CACHE.get(template)
+    if cached is None or cached[0] != version:
+        html = render_template(template, **load_context())
+        cached = _PAGE_CACHE[template] = (version, html, hashlib.sha1(html.encode('utf-8')).hexdigest())
+    response = Response(cached[1], mimetype='text/html')
+    response.set_etag(cached[2])
+    return response.make_conditional(request)
 
 
 # Routes
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_cached('index.html')
 
 @app.route('/catalog')
 def course_catalog():
-    courses = load_courses()
-    return render_template('course_catalog.html', courses=courses)
+    # Read the version before any rows so a concurrent insert can only make a render newer than it
+    version = catalog_version()
+    return render_cached('course_catalog.html', version, lambda: {'courses': load_courses()})
 
 
 @app.route('/course/<code>')
 def course_details(code):
-    courses = load_courses()
-    course = next((course for course in courses if course['code'] == code), None)
+    course = load_course(code)
     if not course:
         flash(f"No course found with code '{code}'.", "error")
         return redirect(url_for('course_catalog'))
@@ -48,4 +138,5 @@ def course_details(code):
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; in production run `gunicorn app:app` (see gunicorn.conf.py)
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', threaded=True)